@@ -0,0 +1,120 @@
+# End to end check for the shared memory bridge, the event stream and the metrics exporter
+# Runs HostComms against SimulatedDispenser in this process and an app in a child process that talks to it
+# through BridgeClient, then checks the @iD, $FD and @fl sequence on both sides and the OpenMetrics output,
+# then reconnects and checks a new bridge command runs exactly once.
+# Usage: python benchmarks/bridge_check.py
+# 10/19/2026
+#---------------------------------------------------------------------------------------------------#
+import asyncio
+import contextlib
+import os
+import sys
+from multiprocessing import Process
+
+from candycom import BridgeClient, CandyBridge, HostComms
+from candycom.candyfault import SimulatedDispenser
+from candycom.candymetrics import MetricsExporter
+
+#---------------------------------------------------------------------------------------------------#
+# App side, runs in the child process
+
+def app_process(bridge):
+    client = BridgeClient(bridge)
+    frames = []
+    if client.dispense_candy():
+        for _ in range(2): # @iD then $FD
+            record = client.wait(timeout=5)
+            if record is None:
+                break
+            frames.append(record[2])
+    client.disconnect()
+    record = client.wait(timeout=5)
+    if record is not None:
+        frames.append(record[2])
+    print(f"app received {frames}")
+    sys.exit(0 if frames == [b"@iD", b"$FD", b"@fl"] else 1)
+
+#---------------------------------------------------------------------------------------------------#
+# candycom side
+
+async def scrape(port, path) -> bytes:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode('latin-1'))
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response.split(b"\r\n\r\n", 1)[1]
+
+async def run_host(bridge, log):
+    dispenser = SimulatedDispenser()
+    host = HostComms(transport=dispenser)
+    bridge.attach(host)
+    # Sent before any connection, must be discarded rather than dispensed on connect
+    BridgeClient(bridge).dispense_candy()
+    exporter = MetricsExporter({"sim": host})
+    with contextlib.redirect_stdout(log): # HostComms prints every frame
+        await asyncio.wait_for(host.establish_connection(), 10)
+    events = host.events()
+    app = Process(target=app_process, args=(bridge,), daemon=True)
+    app.start()
+
+    kinds = []
+    with contextlib.redirect_stdout(log):
+        async with events:
+            try:
+                async for event in events: # Ends when the app's ~FL disconnects the host
+                    kinds.append(event.kind)
+            except asyncio.CancelledError:
+                pass
+        await asyncio.get_running_loop().run_in_executor(None, app.join, 10)
+        await exporter.start(port=0)
+        port = exporter.servers[0].sockets[0].getsockname()[1]
+        exporter.take_snapshot()
+        metrics = await scrape(port, "/metrics")
+        await exporter.stop()
+
+        # Reconnect: a fresh bridge handler must run a new command exactly once
+        await asyncio.wait_for(host.establish_connection(), 10)
+        client = BridgeClient(bridge) # The app process has exited, so this is the only producer
+        client.dispense_candy()
+        loop = asyncio.get_running_loop()
+        after_reconnect = []
+        for _ in range(3): # @iD, $FD and nothing else within the timeout
+            record = await loop.run_in_executor(None, client.wait, 1.5)
+            if record is None:
+                break
+            after_reconnect.append(record[2])
+        session = [host.run_comm_handler, host.run_connection_watchdog, host.run_deadline_scheduler]
+        await host.disconnect_recognized()
+        await asyncio.gather(*session, return_exceptions=True) # Let their exit messages land in the log
+
+    checks = {
+        "app saw @iD, $FD, @fl over the bridge"     :   app.exitcode == 0,
+        "event stream saw the same sequence"        :   kinds == ["candy_dispensed", "candy_taken", "disconnected"],
+        "stale bridge command was discarded"        :   dispenser.stats["dispensed"] == 2,
+        "command after reconnect ran exactly once"  :   after_reconnect == [b"@iD", b"$FD"],
+        "bridge handler stopped on disconnect"      :   host.run_bridge_handler is None,
+        "event subscription closed"                 :   events.closed and events not in host.event_hub.subscribers,
+        "metrics report one dispense"               :   b'candycom_dispenses_total{device="sim"} 1\n' in metrics,
+        "metrics report one take"                   :   b'candycom_takes_total{device="sim"} 1\n' in metrics,
+        "metrics report disconnected"               :   b'candycom_connected{device="sim"} 0\n' in metrics,
+        "metrics end with # EOF"                    :   metrics.endswith(b"# EOF\n"),
+    }
+    for name, ok in checks.items():
+        print(f"{name:<44}{'OK' if ok else 'FAIL'}")
+    return all(checks.values())
+
+def main():
+    bridge = CandyBridge()
+    try:
+        with open(os.devnull, "w") as log:
+            ok = asyncio.run(run_host(bridge, log))
+    finally:
+        bridge.close()
+    if not ok:
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# Allocation benchmark for the ClientComms frame path
+# Runs ClientComms.service_link, the pass comm_handler makes over the link, under CPython with stubbed
+# board modules and fails if a frame allocates more than the budget. tracemalloc cannot count short
+# lived allocations directly, so the budget is the transient peak: bytes allocated above the baseline
+# at any point while a frame is processed. ~ID runs the async dispense_candy handler, which allocates
+# a coroutine and a task by design, so it is checked against its own budget. --reliable runs the same
+# frames through candyreliable.ReliableStream, with the stub serial port playing the host end.
+# Usage: python benchmarks/client_alloc.py [--frames N] [--budget BYTES] [--dispense-budget BYTES] [--reliable]
+# 10/19/2026
+#---------------------------------------------------------------------------------------------------#
+import argparse
+import asyncio
+import sys
+import time
+import tracemalloc
+import types
+
+import candycom.candycom as candycom
+from candycom.candyreliable import ReliableEngine
+
+# dispense_candy is a coroutine that awaits the motor and spawns watch_for_taken, about 1.2 kB on
+# CPython 3.11. It runs once per reward, so it is held to a fixed budget rather than zero
+DISPENSE_BUDGET = 1536
+
+#---------------------------------------------------------------------------------------------------#
+# Stub the CircuitPython modules ClientComms touches
+
+class StubPin:
+    def __init__(self, *args, **kwargs):
+        self.value = False
+        self.direction = None
+
+class StubMotor:
+    def __init__(self, config):
+        self.watch_for_taken = False # watch_for_taken exits straight away
+        self.track_num_dispnesed = 0
+        self.candy_taken = False
+
+    async def rotate_motor(self): # Finishes without suspending so the handler can be stepped
+        pass
+
+class StubSerial:
+    def __init__(self):
+        self.frame = None # Frame delivered by the next readinto, set by the benchmark
+        self.last_written = None
+
+    @property
+    def in_waiting(self):
+        return 3 if self.frame is not None else 0
+
+    def readinto(self, buf): # Copy without allocating, like the real usb_cdc buffer
+        frame = self.frame
+        buf[0] = frame[0] # Element-wise, slicing would allocate a slice object
+        buf[1] = frame[1]
+        buf[2] = frame[2]
+        self.frame = None
+        return 3
+
+    def write(self, data): # Keep a reference only, counting would allocate ints past 256
+        self.last_written = data
+
+    def deliver(self, frame): # Called outside the measured window
+        self.frame = frame
+
+class StubReliableSerial: # Plays the host end of candyreliable, its packets are built outside the window
+    def __init__(self, size=256):
+        self.host = ReliableEngine()
+        self.inbound = bytearray(size)
+        self.in_len = 0
+        self.in_pos = 0
+        self.outbound = bytearray(size)
+        self.out_len = 0
+
+    @property
+    def in_waiting(self):
+        return self.in_len - self.in_pos
+
+    def readinto(self, buf): # Element-wise copies, like the real usb_cdc buffer
+        count = 0
+        while count < len(buf) and self.in_pos < self.in_len:
+            buf[count] = self.inbound[self.in_pos]
+            self.in_pos += 1
+            count += 1
+        return count
+
+    def write(self, data):
+        index = 0
+        while index < len(data):
+            self.outbound[self.out_len] = data[index]
+            self.out_len += 1
+            index += 1
+        return index
+
+    def load(self, packet):
+        index = 0
+        while index < len(packet):
+            self.inbound[self.in_len] = packet[index]
+            self.in_len += 1
+            index += 1
+
+    def deliver(self, frame): # Ack what the client sent and queue the next frame, outside the window
+        self.host.feed(self.outbound[:self.out_len])
+        self.out_len = 0
+        while self.host.receive() is not None:
+            pass
+        self.in_len = 0
+        self.in_pos = 0
+        self.host.send(frame)
+        self.host.poll(time.monotonic(), self.load)
+
+def install_stubs(serial):
+    candycom.digitalio = types.SimpleNamespace(DigitalInOut=StubPin, Direction=types.SimpleNamespace(OUTPUT=1))
+    candycom.neopixel = types.SimpleNamespace(NeoPixel=lambda pin, count: [None] * count)
+    candycom.motorcontrol = types.SimpleNamespace(StepperMotor=StubMotor)
+    candycom.microcontroller = types.SimpleNamespace(reset=lambda: None)
+    candycom.usb_cdc = types.SimpleNamespace(data=serial)
+
+#---------------------------------------------------------------------------------------------------#
+# Drive one frame through service_link the way comm_handler does, until the link goes idle
+
+def step(pending): # Run an async handler to completion without the event loop allocating for it
+    try:
+        pending.send(None)
+    except StopIteration:
+        return
+    raise RuntimeError("handler suspended, the benchmark stubs should never block")
+
+def run_frame(client):
+    pending = client.service_link()
+    while client.link_busy:
+        if pending is not None:
+            step(pending)
+        pending = client.service_link()
+
+def peak_above(func): # Peak bytes above the baseline while func runs
+    baseline = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    func()
+    return tracemalloc.get_traced_memory()[1] - baseline
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+async def measure(client, serial, frames, count): # Returns sorted samples for ~ID and for every other frame
+    dispense = [0] * count # Preallocated so recording a sample does not show up in the next one
+    other = [0] * count
+    dispense_count = 0
+    other_count = 0
+    for index in range(count):
+        frame = frames[index % len(frames)]
+        serial.deliver(frame)
+        if client.reliable: # CPython allocates ints past 256 and CircuitPython does not, keep the counters small
+            stats = client.link.engine.stats
+            for key in stats:
+                stats[key] = 0
+        sample = peak_above(lambda: run_frame(client))
+        if frame == b"~ID":
+            dispense[dispense_count] = sample
+            dispense_count += 1
+            client.alert_candy_taken() # Report the candy as taken so the host's @fd ack clears the flag again
+        else:
+            other[other_count] = sample
+            other_count += 1
+        await asyncio.sleep(0) # Outside the window, let the watch_for_taken task dispense_candy spawned finish
+    return sorted(dispense[:dispense_count]), sorted(other[:other_count])
+
+def report(name, samples, overhead, budget) -> bool:
+    samples = [max(0, sample - overhead) for sample in samples]
+    p99 = percentile(samples, 0.99)
+    print(f"{name} frames: {len(samples)}")
+    print(f"  median transient bytes/frame: {percentile(samples, 0.50)}")
+    print(f"  p99 transient bytes/frame: {p99}")
+    print(f"  worst transient bytes/frame: {samples[-1]}")
+    print(f"  budget: {budget}")
+    # Real allocations on the hot path happen on every frame, so p99 ignores rare interpreter noise
+    return p99 <= budget
+
+async def main():
+    parser = argparse.ArgumentParser(description="ClientComms allocation benchmark")
+    parser.add_argument("--frames", type=int, default=10000)
+    parser.add_argument("--budget", type=int, default=0, help="allowed transient bytes per frame (p99)")
+    parser.add_argument("--dispense-budget", type=int, default=DISPENSE_BUDGET,
+                        help="allowed transient bytes per ~ID frame (p99)")
+    parser.add_argument("--reliable", action="store_true", help="run the frames through ReliableStream")
+    args = parser.parse_args()
+
+    frames = [b"~RS", b"~ID", b"@fd", b"$$$"] # maintain, dispense, ack and a corrupted frame
+    serial = StubReliableSerial() if args.reliable else StubSerial()
+    install_stubs(serial)
+    client = candycom.ClientComms({"connected_led_pin": None, "neopixel_pin": None}, reliable=args.reliable)
+    client.is_connected = True
+
+    await measure(client, serial, frames, 400) # Warm up caches and interned objects before measuring
+
+    tracemalloc.start()
+    # The measurement itself occasionally allocates, subtract its typical cost
+    noop = sorted(peak_above(lambda: None) for _ in range(args.frames))
+    overhead = percentile(noop, 0.50)
+    dispense, other = await measure(client, serial, frames, args.frames)
+    tracemalloc.stop()
+
+    ok = report("~ID", dispense, overhead, args.dispense_budget)
+    ok = report("other", other, overhead, args.budget) and ok
+    if not ok:
+        print("FAIL: allocation budget exceeded")
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    asyncio.run(main())
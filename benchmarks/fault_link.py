@@ -0,0 +1,105 @@
+# Link fault benchmark for HostComms
+# Runs HostComms against the simulated dispenser through FaultyTransport for each fault profile and
+# reports goodput, dispense completion latency and recovery time after disconnects.
+# A simulated disconnect only drops bytes for the outage, the transport never reports the link as lost, so
+# recovery_s is the time back to a completed dispense after a byte level outage (nan when no dispense was
+# in flight across one). The watchdog timeout and establish_connection reconnect paths are not measured.
+# Usage: python benchmarks/fault_link.py [--dispenses N] [--timeout SECONDS] [--profile NAME ...] [--reliable]
+# 10/19/2026
+#---------------------------------------------------------------------------------------------------#
+import argparse
+import asyncio
+import contextlib
+import os
+import time
+
+from candycom import HostComms
+from candycom.candyfault import FaultyTransport, SimulatedDispenser, fault_profiles
+from candycom.candyreliable import ReliableTransport
+
+#---------------------------------------------------------------------------------------------------#
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+async def wait_for_kind(events, kind, deadline): # Returns the event time, or None on timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        try:
+            event = await asyncio.wait_for(events.get(), remaining)
+        except asyncio.TimeoutError:
+            return None
+        if event is None:
+            return None
+        if event.kind == kind:
+            return event.timestamp
+
+async def run_profile(profile, dispenses, timeout, gap, reliable):
+    dispenser = SimulatedDispenser(reliable=reliable)
+    link = FaultyTransport(dispenser, profile, frame_size=1 if reliable else 3) # ReliableTransport reads bytewise
+    host = HostComms(transport=ReliableTransport(link) if reliable else link)
+
+    await asyncio.wait_for(host.establish_connection(), 30)
+    events = host.events()
+    latencies = []
+    completions = []
+    start = time.monotonic()
+    for _ in range(dispenses):
+        sent = time.monotonic()
+        host.dispense_candy()
+        done = await wait_for_kind(events, "candy_dispensed", sent + timeout)
+        if done is not None:
+            latencies.append(done - sent)
+            completions.append(done)
+        await asyncio.sleep(gap)
+    elapsed = time.monotonic() - start
+
+    session = [host.run_comm_handler, host.run_connection_watchdog, host.run_deadline_scheduler]
+    await host.disconnect_recognized() # Tear down the background tasks as if the dispenser acked ~FL
+    await asyncio.gather(*session, return_exceptions=True) # Their exit messages must land in devnull, not the table
+
+    # Recovery: time from the end of each outage to the next completed dispense
+    recoveries = []
+    for _, outage_end in link.outages:
+        later = [done for done in completions if done >= outage_end]
+        if later:
+            recoveries.append(later[0] - outage_end)
+
+    frames = host.link_stats["frames_received"] + dispenser.stats["frames_received"]
+    return {
+        "completed"     :   len(latencies),
+        "goodput"       :   frames / elapsed, # valid frames per second, both ends
+        "bytes_per_ok"  :   link.stats["bytes_sent"] / max(1, len(latencies)),
+        "p50_ms"        :   percentile(latencies, 0.50) * 1000,
+        "p99_ms"        :   percentile(latencies, 0.99) * 1000,
+        "outages"       :   len(link.outages),
+        "recovery_s"    :   max(recoveries) if recoveries else float("nan"),
+        "dropped"       :   link.stats["bytes_dropped"],
+        "corrupted"     :   link.stats["bytes_corrupted"],
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="HostComms link fault benchmark")
+    parser.add_argument("--dispenses", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=2.0, help="seconds before a dispense counts as lost")
+    parser.add_argument("--gap", type=float, default=0.05, help="seconds between dispenses")
+    parser.add_argument("--profile", nargs="*", default=list(fault_profiles))
+    parser.add_argument("--reliable", action="store_true", help="run both ends over candyreliable")
+    args = parser.parse_args()
+
+    print(f"{'profile':<14}{'ok':>6}{'goodput/s':>11}{'bytes/ok':>10}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'outages':>9}{'recov s':>9}{'dropped':>9}{'corrupt':>9}")
+    for name in args.profile:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull): # HostComms prints every frame
+            result = await run_profile(fault_profiles[name], args.dispenses, args.timeout, args.gap, args.reliable)
+        print(f"{name:<14}{result['completed']:>3}/{args.dispenses:<2}{result['goodput']:>11.1f}"
+              f"{result['bytes_per_ok']:>10.1f}{result['p50_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+              f"{result['outages']:>9}{result['recovery_s']:>9.2f}{result['dropped']:>9}{result['corrupted']:>9}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,167 @@
+# Deterministic checks for the candyreliable engine
+# Connects two ReliableEngines through a scripted channel on a simulated clock and checks that every
+# frame arrives once and in order under loss, reordering, corruption and sequence number wraparound,
+# and that resends are selective: a lost packet is resent on its own, not with the rest of the window.
+# Also runs ReliableTransport end to end over BleSerialAdapter with a stand-in UART service.
+# Usage: python benchmarks/reliable_check.py
+# 10/19/2026
+#---------------------------------------------------------------------------------------------------#
+import random
+import sys
+import time
+import types
+
+from candycom.candyfault import BleSerialAdapter, FaultProfile, FaultyTransport, SimulatedDispenser
+from candycom.candyreliable import ReliableEngine, ReliableTransport, SEQ_SPACE
+
+#---------------------------------------------------------------------------------------------------#
+
+def make_frame(index) -> bytes: # Distinct printable frames so order and duplicates can be checked
+    return bytes((65 + index % 26, 65 + index // 26 % 26, 65 + index // 676 % 26))
+
+class Channel: # One direction, decides the fate of each packet from a script
+    def __init__(self, fate):
+        self.fate = fate # fate(count, packet) -> "ok", "drop", "hold" or "corrupt"
+        self.count = 0
+        self.in_transit = []
+        self.held = []
+
+    def write(self, packet): # poll() reuses its buffer, so copy
+        packet = bytearray(packet)
+        fate = self.fate(self.count, packet)
+        self.count += 1
+        if fate == "drop":
+            return
+        if fate == "corrupt":
+            packet[4] ^= 0x80
+        if fate == "hold": # Delivered after the next packet, which swaps their order
+            self.held.append(packet)
+            return
+        self.in_transit.append(packet)
+        self.in_transit.extend(self.held)
+        self.held.clear()
+
+    def deliver(self, engine, flush=False):
+        if flush:
+            self.in_transit.extend(self.held)
+            self.held.clear()
+        for packet in self.in_transit:
+            engine.feed(packet)
+        self.in_transit.clear()
+
+def run(name, frames, forward, backward, window=16, step=0.05, limit=20000, resends=None):
+    # resends, if given, is the exact number of retransmits allowed, with no duplicates at the receiver
+    sender = ReliableEngine(window)
+    receiver = ReliableEngine(window)
+    there = Channel(forward)
+    back = Channel(backward)
+    expected = [make_frame(index) for index in range(frames)]
+    received = []
+    queued = 0
+    now = 0.0
+    for tick in range(limit):
+        while queued < frames and queued - len(received) < 3 * window: # Queue ahead, exercising the backlog
+            sender.send(expected[queued])
+            queued += 1
+        sender.poll(now, there.write)
+        there.deliver(receiver, flush=tick % 7 == 6)
+        frame = receiver.receive()
+        while frame is not None:
+            received.append(frame)
+            frame = receiver.receive()
+        receiver.poll(now, back.write)
+        back.deliver(sender, flush=tick % 7 == 6)
+        now += step
+        if len(received) == frames and sender.in_flight() == 0:
+            break
+    ok = received == expected and sender.in_flight() == 0
+    if resends is not None:
+        ok = ok and sender.stats["retransmits"] == resends and receiver.stats["duplicates"] == 0
+    print(f"{name:<24}{'OK' if ok else 'FAIL':<6}frames {len(received)}/{frames}  ticks {tick + 1}  "
+          f"retransmits {sender.stats['retransmits']}  duplicates {receiver.stats['duplicates']}  "
+          f"bad packets {receiver.stats['bad_packets'] + sender.stats['bad_packets']}")
+    return ok
+
+def seeded(rate, fate, seed):
+    rng = random.Random(seed)
+    return lambda count, packet: fate if rng.random() < rate else "ok"
+
+def drop_first_try(every): # Drop alternate sends of every nth sequence number, so each is lost at least once
+    sends = [0] * SEQ_SPACE
+    def fate(count, packet):
+        seq = packet[2]
+        sends[seq] += 1
+        return "drop" if seq % every == every - 1 and sends[seq] % 2 == 1 else "ok"
+    return fate
+
+class StubUartService: # Behaves like adafruit_ble's UARTService: bytes in, bytes or None out
+    def __init__(self, backend):
+        self.backend = backend
+
+    @property
+    def in_waiting(self):
+        self.backend.check_ser_buffer() # Releases replies that are due
+        return len(self.backend.outgoing)
+
+    def read(self, nbytes):
+        return self.backend.read_bytes(nbytes) or None
+
+    def write(self, data):
+        if not isinstance(data, bytes):
+            raise TypeError("UARTService.write takes bytes")
+        self.backend.write(data)
+
+    def reset_input_buffer(self):
+        self.backend.flush_ser_buffer()
+
+def ble_link(reliable, profile):
+    dispenser = SimulatedDispenser(dispense_time=0.01, take_time=0.01, reliable=reliable)
+    adapter = BleSerialAdapter(types.SimpleNamespace(uart_service=StubUartService(dispenser)))
+    return FaultyTransport(adapter, profile, frame_size=1 if reliable else 3)
+
+def run_ble(name, reliable, profile, timeout=5.0): # A dispense must come back as @iD then $FD
+    link = ble_link(reliable, profile)
+    transport = ReliableTransport(link) if reliable else link
+    received = []
+    try:
+        transport.write("~ID")
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and received[-2:] != ["@iD", "$FD"]:
+            if transport.check_ser_buffer():
+                received.append(transport.read(3))
+            time.sleep(0.001)
+        ok = received[-2:] == ["@iD", "$FD"] if reliable else True # Plain mode only has to survive the noise
+        error = ""
+    except Exception as e:
+        ok = False
+        error = f"  {type(e).__name__}: {e}"
+    print(f"{name:<24}{'OK' if ok else 'FAIL':<6}frames {received}  corrupted {link.stats['bytes_corrupted']}{error}")
+    return ok
+
+def main():
+    clean = lambda count, packet: "ok"
+    wrap = 3 * SEQ_SPACE + 5 # Every check runs past the sequence space several times
+    results = [
+        run("clean", wrap, clean, clean),
+        run("one lost in a burst", 16, lambda count, packet: "drop" if count == 0 else "ok", clean, resends=1),
+        run("two lost in a burst", 16, lambda count, packet: "drop" if count in (3, 9) else "ok", clean, resends=2),
+        run("drop every 5th frame", wrap, drop_first_try(5), clean),
+        run("drop every 3rd ack", wrap, clean, lambda count, packet: "drop" if count % 3 == 2 else "ok"),
+        run("random loss both ways", wrap, seeded(0.2, "drop", 1), seeded(0.2, "drop", 2)),
+        run("swap adjacent packets", wrap, lambda count, packet: "hold" if count % 2 == 0 else "ok", clean),
+        run("random reordering", wrap, seeded(0.3, "hold", 3), seeded(0.3, "hold", 4)),
+        run("corrupted packets", wrap, seeded(0.1, "corrupt", 5), seeded(0.1, "corrupt", 6)),
+        run("window 64 with loss", wrap, seeded(0.1, "drop", 7), seeded(0.1, "drop", 8), window=64),
+        run("window 5 with loss", wrap, seeded(0.1, "drop", 9), seeded(0.1, "drop", 10), window=5),
+        run("window 1 with loss", SEQ_SPACE + 5, seeded(0.1, "drop", 11), clean, window=1),
+        run_ble("ble plain, all corrupt", False, FaultProfile(corrupt_rate=1.0, seed=12), timeout=0.5),
+        run_ble("ble reliable, clean", True, FaultProfile()),
+        run_ble("ble reliable, noisy", True, FaultProfile(latency=0.005, drop_rate=0.02, corrupt_rate=0.02, seed=13)),
+    ]
+    if not all(results):
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,5 @@
+import sys
 from .candycom import HostComms, ClientComms
+from .candyevents import CandyEvent
+if sys.implementation.name != 'circuitpython':
+    from .candybridge import CandyBridge, BridgeClient
@@ -27,7 +27,8 @@ class BleClient():
             pass
 
     def write(self, data):
-        data = data.encode('utf-8')
+        if isinstance(data, str):
+            data = data.encode('utf-8')
         self.uart.write(data)
 
     def read(self):
@@ -62,4 +63,4 @@ class BleHost():
 
     def read(self):
         data = self.uart_service.read(3)
-        return data.decode('utf-8')
+        return data.decode('utf-8', errors='replace')
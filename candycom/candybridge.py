@@ -0,0 +1,249 @@
+# Shared memory bridge between candycom and a host application (PsychoPy, etc.)
+# Replaces the Pipe based integration pattern: no pickled messages, no polling loops
+# 10/19/2026
+#---------------------------------------------------------------------------------------------------#
+import asyncio
+import os
+import struct
+import time
+from multiprocessing import Pipe, Semaphore
+from multiprocessing.shared_memory import SharedMemory
+
+#---------------------------------------------------------------------------------------------------#
+# Fixed size records and ring layout
+#
+# Every record is 16 bytes: sequence id, monotonic timestamp and the 3 byte candycom frame.
+# Each ring starts with a 16 byte header holding the write index, read index and a dropped counter.
+# Only one process ever writes a given index, so no locks are needed (single producer, single consumer).
+
+RECORD_FORMAT = "<Id3sx"  # seq, timestamp, frame, pad
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+HEADER_FORMAT = "<IIIxxxx"  # head, tail, dropped, pad
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# Frames the app is allowed to send, mapped to the HostComms method that carries them out
+bridge_commands = {
+    b"~ID" : "dispense_candy",
+    b"~FL" : "disconnect",
+}
+
+# Frames published by HostComms to the app
+bridge_events = {
+    b"@iD" : "candy_dispensed",
+    b"$FD" : "candy_taken",
+    b"%JP" : "jam_or_empty",
+    b"@fl" : "disconnected",
+}
+
+class SharedRing:
+    def __init__(self, buf, offset: int, capacity: int):
+        self.buf = buf
+        self.offset = offset
+        self.records = offset + HEADER_SIZE
+        self.capacity = capacity
+
+    def _header(self):
+        return struct.unpack_from(HEADER_FORMAT, self.buf, self.offset)
+
+    def _set_head(self, head: int):
+        struct.pack_into("<I", self.buf, self.offset, head)
+
+    def _set_tail(self, tail: int):
+        struct.pack_into("<I", self.buf, self.offset + 4, tail)
+
+    def _add_dropped(self):
+        dropped = struct.unpack_from("<I", self.buf, self.offset + 8)[0]
+        struct.pack_into("<I", self.buf, self.offset + 8, (dropped + 1) & 0xFFFFFFFF)
+
+    @property
+    def size(self) -> int:
+        head, tail, _ = self._header()
+        return (head - tail) & 0xFFFFFFFF
+
+    @property
+    def dropped(self) -> int:
+        return self._header()[2]
+
+    def is_empty(self) -> bool:
+        return self.size == 0
+
+    def is_full(self) -> bool:
+        return self.size >= self.capacity
+
+    def push(self, frame: bytes, stamp: float) -> bool: # Producer side, returns False if the record was dropped
+        head, tail, _ = self._header()
+        if (head - tail) & 0xFFFFFFFF >= self.capacity:
+            self._add_dropped()
+            return False
+        slot = self.records + (head % self.capacity) * RECORD_SIZE
+        struct.pack_into(RECORD_FORMAT, self.buf, slot, head, stamp, frame)
+        self._set_head((head + 1) & 0xFFFFFFFF) # Publish only after the record is written
+        return True
+
+    def pop(self): # Consumer side, returns (seq, timestamp, frame) or None
+        head, tail, _ = self._header()
+        if head == tail:
+            return None
+        slot = self.records + (tail % self.capacity) * RECORD_SIZE
+        record = struct.unpack_from(RECORD_FORMAT, self.buf, slot)
+        self._set_tail((tail + 1) & 0xFFFFFFFF)
+        return record
+
+#---------------------------------------------------------------------------------------------------#
+# Create the bridge, instance it in the parent process and hand it to the candycom process
+
+class CandyBridge:
+    def __init__(self, capacity=64, name=None):
+        self.capacity = capacity
+        ring_size = HEADER_SIZE + capacity * RECORD_SIZE
+        self.shm = SharedMemory(name=name, create=True, size=ring_size * 2)
+        self.shm.buf[:ring_size * 2] = bytes(ring_size * 2)
+        self.owner_pid = os.getpid() # With fork the child shares this object, only the creator unlinks
+        # The app blocks on a semaphore for events. candycom waits on the read end of a pipe from its event
+        # loop instead, every command pushed writes one wakeup message. Outstanding wakeups are bounded by
+        # the ring capacity since a full ring refuses the command, so the pipe never fills up
+        self.command_wakeup, self.command_notify = Pipe(duplex=False)
+        self.event_ready = Semaphore(0)
+        self._map_rings()
+
+    def _map_rings(self):
+        ring_size = HEADER_SIZE + self.capacity * RECORD_SIZE
+        self.commands = SharedRing(self.shm.buf, 0, self.capacity)  # app -> candycom
+        self.events = SharedRing(self.shm.buf, ring_size, self.capacity)  # candycom -> app
+        self.host = None
+
+    # Only the shared memory name, the pipe and the semaphore cross the process boundary
+    def __getstate__(self):
+        return {
+            "capacity": self.capacity,
+            "name": self.shm.name,
+            "command_wakeup": self.command_wakeup,
+            "command_notify": self.command_notify,
+            "event_ready": self.event_ready,
+        }
+
+    def __setstate__(self, state):
+        self.capacity = state["capacity"]
+        self.shm = SharedMemory(name=state["name"])
+        self.owner_pid = None
+        self.command_wakeup = state["command_wakeup"]
+        self.command_notify = state["command_notify"]
+        self.event_ready = state["event_ready"]
+        self._map_rings()
+
+    def client(self): # Create the app side handle
+        return BridgeClient(self)
+
+    # candycom process side
+    def attach(self, host): # Route HostComms events into the bridge
+        self.host = host
+        host.bridge = self
+        if host.is_connected and host.run_bridge_handler is None: # Attached after establish_connection
+            host.run_bridge_handler = asyncio.create_task(self.bridge_handler(host))
+
+    def publish(self, frame, stamp=None): # Called by HostComms when an event happens
+        if isinstance(frame, str):
+            frame = frame.encode('utf-8')
+        if stamp is None:
+            stamp = time.monotonic()
+        if self.events.push(frame, stamp):
+            self.event_ready.release()
+
+    def _drain_wakeups(self):
+        while self.command_wakeup.poll():
+            self.command_wakeup.recv_bytes()
+
+    def discard_commands(self) -> int: # Drop commands nobody handled, returns how many
+        self._drain_wakeups()
+        discarded = 0
+        while self.commands.pop() is not None:
+            discarded += 1
+        return discarded
+
+    async def bridge_handler(self, host): # Background task started by HostComms once connected
+        loop = asyncio.get_running_loop()
+        print("running bridge_handler")
+        # Commands sent while disconnected belong to trials that are over, never run them on reconnect
+        stale = self.discard_commands()
+        if stale:
+            print(f"Warning: Discarded {stale} bridge commands sent while disconnected")
+        wakeup = asyncio.Event()
+        try:
+            loop.add_reader(self.command_wakeup.fileno(), wakeup.set)
+        except NotImplementedError: # Windows proactor loop, fall back to waiting in a worker thread
+            wakeup = None
+        try:
+            while host.is_connected:
+                if wakeup is not None:
+                    await wakeup.wait()
+                    wakeup.clear()
+                # poll() only peeks, so a wait left running after the task is cancelled cannot eat a wakeup
+                elif not await loop.run_in_executor(None, self.command_wakeup.poll, 0.1):
+                    continue
+                self._drain_wakeups() # Before popping, a command pushed after this still wakes the next pass
+                record = self.commands.pop()
+                while record is not None:
+                    seq, stamp, frame = record
+                    if frame in bridge_commands:
+                        result = getattr(host, bridge_commands[frame])()
+                        if asyncio.iscoroutine(result):
+                            await result
+                    else:
+                        print(f"Warning: Unrecognized bridge command {frame}")
+                    record = self.commands.pop()
+        finally:
+            if wakeup is not None:
+                loop.remove_reader(self.command_wakeup.fileno())
+        print("bridge_handler exited")
+
+    def close(self):
+        self.shm.close()
+        self.command_wakeup.close()
+        self.command_notify.close()
+        if self.owner_pid == os.getpid():
+            self.shm.unlink()
+
+#---------------------------------------------------------------------------------------------------#
+# Create a small client for the app side of the bridge
+
+class BridgeClient:
+    def __init__(self, bridge: CandyBridge):
+        self.bridge = bridge
+        self.commands = bridge.commands
+        self.events = bridge.events
+
+    def send(self, frame) -> bool: # Queue a raw command frame for candycom
+        if isinstance(frame, str):
+            frame = frame.encode('utf-8')
+        if frame not in bridge_commands:
+            print(f"Warning: Unrecognized bridge command {frame}, nothing sent")
+            return False
+        if not self.commands.push(frame, time.monotonic()):
+            return False
+        self.bridge.command_notify.send_bytes(b"\x01") # Wake candycom's bridge_handler
+        return True
+
+    def dispense_candy(self) -> bool:
+        return self.send(b"~ID")
+
+    def disconnect(self) -> bool:
+        return self.send(b"~FL")
+
+    def poll(self): # Return the next event record without blocking, or None
+        return self.events.pop()
+
+    def wait(self, timeout=None): # Block until an event arrives, returns None on timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            record = self.events.pop()
+            if record is not None:
+                return record
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            # Tokens may be stale if poll() consumed records, so always re-check the ring
+            self.bridge.event_ready.acquire(True, remaining)
+
+    @property
+    def dropped_events(self) -> int:
+        return self.events.dropped
@@ -7,6 +7,9 @@ import asyncio
 import sys
 import time
 from .candyble import *
+from .candyevents import EventHub
+from .candyscheduler import DeadlineScheduler
+from .candyreliable import ReliableStream
 # import different libraries depending upon platform
 if sys.implementation.name != 'circuitpython':
     from .candyserial import *
@@ -54,6 +57,20 @@ ack_dict = {
     "$FD"   : "@fd", # Candy taken ack
 }
 
+# Constant lookup tables so the client hot path does not build views or encode per frame
+comm_frames = tuple(comm_dict.values())
+ack_frames = tuple(ack_dict.values())
+frame_bytes = {frame: frame.encode('utf-8') for frame in comm_frames + ack_frames}
+frame_table = tuple((encoded, frame) for frame, encoded in frame_bytes.items())
+
+def lookup_frame(buf): # Map raw frame bytes to the shared frame string without decoding, None if unknown
+    index = 0 # Indexed loop, a for loop allocates an iterator on CPython
+    while index < len(frame_table):
+        if buf == frame_table[index][0]:
+            return frame_table[index][1]
+        index += 1
+    return None
+
 #---------------------------------------------------------------------------------------------------#
 # Create Circular Buffers to be used by each role
 
@@ -103,20 +120,33 @@ class CircBuffer:
 # Create Class for the client side of the protocol
 
 class ClientComms:
-    def __init__(self, board_config, comm_mode="serial", buffer_size=64):
+    def __init__(self, board_config, comm_mode="serial", buffer_size=64, debug=False, reliable=False):
         # Configure conection leds
         self.connected_led = digitalio.DigitalInOut(board_config["connected_led_pin"])
         self.connected_led.direction = digitalio.Direction.OUTPUT
         self.timeout = time.monotonic()
         self.pixels = neopixel.NeoPixel(board_config["neopixel_pin"], 1)
+        self.pixels_lit = False
+        self.link_busy = False # Set by service_link when the last pass moved or handled a frame
         # Configure beam breakers for candy taken
 
+        # Preallocate the receive frame, read into it instead of allocating bytes per message
+        self.rx_frame = bytearray(3)
+        self.debug = debug # Per frame prints allocate, only enable them while debugging
+
         # Create two buffer instances
         self.IncommingBuffer = CircBuffer(buffer_size)
         self.OutgoingBuffer = CircBuffer(buffer_size)
         self.stepper_motor = motorcontrol.StepperMotor(board_config)
         self.comm_mode = comm_mode
 
+        # Stream frames are read from and written to, usb_cdc.data or the BLE uart once connected.
+        # With reliable=True it is wrapped in candyreliable.ReliableStream, the host must enable it too
+        self.reliable = reliable
+        self.link = None
+        if comm_mode == "serial":
+            self.open_link(usb_cdc.data)
+
         # Create watchdog management variables
         self.watchdog_timeout = 16 # Roughly every second
         self.watchdog_timer = 0
@@ -130,19 +160,23 @@ class ClientComms:
         "@fd": 0,
         #"report_battery_flag": 0
         }
+
+        # Build the dispatch table once rather than per message. Handlers for frequent frames are plain
+        # methods, only handlers that wait on hardware or the link are coroutines
+        self.message_interpertations = {
+            "~ID"   :   self.dispense_candy,
+            "~RS"   :   self.reset_watchdog,
+            "~FL"   :   self.disconnect,
+        }
 #---------------------------------------------------------------------------------------------------#
     # Create methods for interacting with buffers
+    def open_link(self, stream): # Select the stream used for frames
+        if self.reliable:
+            stream = ReliableStream(stream)
+        self.link = stream
+
     def check_data_on_serial(self) -> bool: # Return True if atleast 3 bytes are on serial buffer
-        if self.comm_mode == "serial": # Use different commands for different methods of connection
-            if usb_cdc.data.in_waiting >= 3:
-                return True
-            else:
-                return False
-        elif self.comm_mode == "ble":
-            if self.ble_ser.uart.in_waiting >= 3:
-                return True
-            else:
-                return False
+        return self.link.in_waiting >= 3
 
     def check_data_outgoing(self) -> bool: # Return True if there is data to send
         return self.OutgoingBuffer.check_data()
@@ -152,11 +186,11 @@ class ClientComms:
 
     def enqueue_message(self, message): # Add message to client outgoing buffer
         # Set flag if the message is recognized format
-        if message in comm_dict.values(): # Defend against non candycom data
+        if message in comm_frames: # Defend against non candycom data
             self.client_flags[ack_dict[message]] += 1
             self.flag_count += 1
             self.OutgoingBuffer.enqueue(message)
-        elif message in ack_dict.values():
+        elif message in ack_frames:
             self.OutgoingBuffer.enqueue(message)
         else:
             return
@@ -164,37 +198,43 @@ class ClientComms:
     def dequeue_message(self): # Pull message from incoming buffer
         if self.IncommingBuffer.check_data(): # Defend against non candycom data
             message = self.IncommingBuffer.dequeue()
-            if message in self.client_flags.keys():
+            if message in self.client_flags:
                 self.client_flags[message] -= 1
                 self.flag_count -= 1
-            if message in comm_dict.keys():
+            if message in comm_dict:
                 self.enqueue_message(ack_dict[message])
 
             return message
 
+    # Create non allocating methods for moving single frames, used by comm_handler
+    def receive_frame(self): # Pull a frame from serial to incoming buffer
+        self.link.readinto(self.rx_frame)
+        message = lookup_frame(self.rx_frame)
+        if self.debug:
+            print(f'recieved: {message}')
+        if message is not None: # Non candycom data is dropped here
+            self.IncommingBuffer.enqueue(message)
+
+    def transmit_frame(self): # write a frame from outgoing to serial buffer
+        message = self.OutgoingBuffer.dequeue()
+        if self.debug:
+            print(f'transmitted: {message}')
+        self.link.write(frame_bytes[message])
+
     # Create async methods for transmitting data
     async def receive_message(self): # Pull message from serial to incoming buffer
-        if self.comm_mode == "serial":
-            message = usb_cdc.data.read(3).decode('utf-8')
-        elif self.comm_mode == "ble":
-            message = self.ble_ser.read()
-        print(f'recieved: {message}')
-        self.IncommingBuffer.enqueue(message)
+        self.receive_frame()
 
     async def transmit_message(self): # write message from outoing to serial buffer
-        message = self.OutgoingBuffer.dequeue()
-        print(f'transmitted: {message}')
-        if self.comm_mode == "serial":
-            usb_cdc.data.write(message.encode('utf-8'))
-        elif self.comm_mode == 'ble':
-            self.ble_ser.write(message)
+        self.transmit_frame()
 
     # Create async watchdog method to maintain the connection
     async def connection_watchdog(self): # counts up every 5 seconds, resets script in timeout achieved
         while self.is_connected:
             if not self.check_data_incoming():
                 self.watchdog_timer += 1
-                print(f"watchdog {self.watchdog_timer}/{self.watchdog_timeout}")
+                if self.debug:
+                    print(f"watchdog {self.watchdog_timer}/{self.watchdog_timeout}")
 
             if self.watchdog_timer == self.watchdog_timeout:
                 self.is_connected = False
@@ -205,37 +245,42 @@ class ClientComms:
         print("watchdog exited successfully")
         microcontroller.reset() # reset the board
 
-    async def reset_watchdog(self): # reset the watchdog counter if the right message is recieved
+    def reset_watchdog(self): # reset the watchdog counter if the right message is recieved
+        # Not a coroutine: ~RS arrives every few seconds and a coroutine object would be allocated per frame
         self.watchdog_timer = 0
         self.enqueue_message(ack_dict[comm_dict["maintain_connection"]])
 
+    # Create the non allocating pass over the link, comm_handler calls it once per iteration
+    def service_link(self): # Move frames and run sync handlers, returns an async handler's coroutine or None
+        self.link_busy = False
+        if self.check_data_on_serial():
+            self.receive_frame()
+            self.link_busy = True
+        if self.check_data_outgoing():
+            self.transmit_frame()
+            self.link_busy = True
+
+        if self.pixels_lit and time.monotonic() > self.timeout: # determine if the neopixels need shut off
+            self.pixels[0] = (0, 0, 0)
+            self.pixels_lit = False
+
+        if self.check_data_incoming():
+            self.link_busy = True
+            return self.interpret_message() # If a message was recieved, execute its function
+        return None
+
     # Create async method used to handle communications
     async def comm_handler(self): # daemon-esq process which automates sending and recieving data over serial/ble
         print("running comm_handler")
-        # Declare two async funcitons for incoming and outgoing to run in asyncio.gather() to run them "toghether"
-        async def incoming_comm_handler():
-            if self.check_data_on_serial():
-                await self.receive_message()
-            else:
-                await asyncio.sleep(0.01)
-
-        async def outgoing_comm_handler():
-            if self.check_data_outgoing():
-                await self.transmit_message()
-            else:
-                await asyncio.sleep(0.01)
-
+        # A single long lived loop moves frames synchronously, so no coroutines are created per iteration
         while self.is_connected:
-            await asyncio.gather( # Run both comm_handler sub methods at the "same time"
-                incoming_comm_handler(),
-                outgoing_comm_handler(),
-            )
-
-            if time.monotonic() > self.timeout: # determine if the neopixels need shut off
-                self.pixels[0] = (0, 0, 0)
-
-            if self.check_data_incoming():
-                await self.mesage_interpreter() # If a message was recieved, execute its function
+            pending = self.service_link()
+            if pending is not None:
+                await pending # Only async handlers, such as dispense_candy, allocate a coroutine
+            elif not self.link_busy:
+                await asyncio.sleep(0.01)
+                continue
+            await asyncio.sleep(0) # Yield so the watchdog and dispense tasks can run
 
         print("comm_handler exited")
 
@@ -257,6 +302,7 @@ class ClientComms:
             print("BLE enabled: waiting for host...")
             self.ble_ser = BleClient()
             self.ble_ser.connect()
+            self.open_link(self.ble_ser.uart)
 
         print("Waiting for connection to be established")
         self.connected_led.value = False
@@ -281,6 +327,7 @@ class ClientComms:
     async def dispense_candy(self): # Called when dispense_candy command is sent from host
         self.timeout = time.monotonic() +0.5
         self.pixels[0] = (0, 10, 0)
+        self.pixels_lit = True
         await self.stepper_motor.rotate_motor()
         watch_taken =  asyncio.create_task(self.watch_for_taken())
         self.enqueue_message(ack_dict[comm_dict["dispense_candy"]])
@@ -308,25 +355,26 @@ class ClientComms:
         microcontroller.reset() # reset the board
 
 
-    async def mesage_interpreter(self): # pull a message from the buffer and figure out what it means
-        message_interpertations = {
-            "~ID"   :   self.dispense_candy,
-            "~RS"   :   self.reset_watchdog,
-            "~FL"   :   self.disconnect,
-
-        }
-
+    def interpret_message(self): # pull a message from the buffer and run its handler
         message = self.dequeue_message()
-        if message in message_interpertations:
-            await message_interpertations[message]()
+        if message in self.message_interpertations:
+            return self.message_interpertations[message]() # A coroutine for async handlers, else None
+        return None
+
+    async def mesage_interpreter(self): # pull a message from the buffer and figure out what it means
+        pending = self.interpret_message()
+        if pending is not None:
+            await pending
 
 #---------------------------------------------------------------------------------------------------#
 # Create Class for the Host side of the protocal
 
 class HostComms:
-    def __init__(self, comm_mode="serial", buffer_size=64):
+    def __init__(self, comm_mode="serial", buffer_size=64, transport=None):
        # determine the means of communications to be used
         self.comm_mode = comm_mode
+        # Optional serial-like transport used instead of opening a port, e.g. candyfault.FaultyTransport
+        self.transport = transport
 
         # configure host based on platform
         global is_arduino
@@ -364,11 +412,31 @@ class HostComms:
         self.candy_stats = {
             "candy_disepnsed"   :   0,
             "candy_taken"       :   0,
+            "jam_or_empty"      :   0,
         }
 
+        self.link_stats = {
+            "frames_sent"       :   0,
+            "frames_received"   :   0,
+            "unknown_frames"    :   0,
+            "watchdog_misses"   :   0,
+        }
+
+        # Optional shared memory bridge to a host application, see candybridge.CandyBridge.attach
+        self.bridge = None
+        self.run_bridge_handler = None
+        # Typed event stream, see events() and add_event_callback()
+        self.event_hub = EventHub()
+        # Deadline scheduler for precisely timed dispenses, see dispense_at()
+        self.scheduler = DeadlineScheduler(self)
+        self.run_deadline_scheduler = None
+
     # Create methods for interacting with buffers
+    def link_is_serial(self) -> bool: # True if frames go through self.candyser, an explicit transport always does
+        return self.transport is not None or self.comm_mode == 'serial'
+
     def check_data_on_serial(self) -> bool:  # Return True if atleast 3 bytes are on serial buffer
-        if self.comm_mode == 'serial': # Use different commands for different methods of connection
+        if self.link_is_serial(): # Use different commands for different methods of connection
             return self.candyser.check_ser_buffer()
         elif self.comm_mode == 'ble':
             if self.ble_ser.uart_service.in_waiting >= 3:
@@ -380,11 +448,14 @@ class HostComms:
     def check_data_incoming(self) -> bool:  # Return True if we recieved data
         return self.IncommingBuffer.check_data()
 
+    def raise_flag(self, message): # Expect an ack for a command that was sent
+        self.host_flags[ack_dict[message]] += 1
+        self.flag_count += 1
+
     def enqueue_message(self, message):  # Add message to host outgoing buffer
         # Set flag if the message is recognized format
         if message in comm_dict.values(): # Defend against non candycom data
-            self.host_flags[ack_dict[message]] += 1
-            self.flag_count += 1
+            self.raise_flag(message)
             self.OutgoingBuffer.enqueue(message)
         elif message in ack_dict.values():
             self.OutgoingBuffer.enqueue(message)
@@ -403,17 +474,30 @@ class HostComms:
 
     # Create async methods for transmitting data
     async def receive_message(self): # Pull message from serial to incoming buffer
-        if self.comm_mode == 'serial':
+        if self.link_is_serial():
             message = self.candyser.read(3)
         elif self.comm_mode == 'ble' :
             message = self.ble_ser.read()
         print(f'recieved: {message}')
+        if message in comm_frames or message in ack_frames:
+            self.link_stats["frames_received"] += 1
+        else:
+            self.link_stats["unknown_frames"] += 1
         self.IncommingBuffer.enqueue(message)
 
     async def transmit_message(self): # write message from outoing to serial buffer
         message = self.OutgoingBuffer.dequeue()
         print(f'transmitted: {message}')
-        if self.comm_mode == 'serial':
+        self.write_message(message)
+
+    def stage_message(self, message): # Encode a frame ahead of time so it can be written without delay
+        if self.link_is_serial():
+            return message.encode('utf-8')
+        return message # BleHost encodes on write
+
+    def write_message(self, message): # Write a frame straight to the link, bypassing the outgoing buffer
+        self.link_stats["frames_sent"] += 1
+        if self.link_is_serial():
             self.candyser.write(message)
         elif self.comm_mode == 'ble':
             self.ble_ser.write(message)
@@ -422,13 +506,18 @@ class HostComms:
     async def connection_watchdog(self): # counts up every 5 seconds, resets script in timeout achieved
         while self.is_connected:
             if not self.check_data_incoming():
+                if self.watchdog_timer > 0: # The previous maintain_connection was never acked
+                    self.link_stats["watchdog_misses"] += 1
                 self.watchdog_timer += 1
                 print(f"watchdog {self.watchdog_timer}/{self.watchdog_timeout}")
                 self.enqueue_message(comm_dict["maintain_connection"])
 
             if self.watchdog_timer == self.watchdog_timeout:
                 self.is_connected = False
-                if self.comm_mode == 'ble':
+                self.cancel_session_tasks()
+                self.publish_event(ack_dict[comm_dict["disconnect"]])
+                self.event_hub.close_subscriptions()
+                if not self.link_is_serial():
                     self.ble_ser.disconnect()
             await asyncio.sleep(5)
         print("watchdog exited successfully")
@@ -437,6 +526,15 @@ class HostComms:
     async def reset_watchdog(self): # Reset the watchdog is the right ack is sent by client
         self.watchdog_timer = 0
 
+    def cancel_session_tasks(self): # Stop the bridge handler and deadline scheduler so a reconnect starts fresh ones
+        if self.run_bridge_handler is not None:
+            self.run_bridge_handler.cancel()
+            self.run_bridge_handler = None
+        if self.run_deadline_scheduler is not None:
+            self.run_deadline_scheduler.cancel()
+            self.run_deadline_scheduler = None
+        self.scheduler.clear() # Deadlines belong to trials of this session, never fire them late after a reconnect
+
     async def comm_handler(self):
         print("running comm_handler")
         # Declare two async funcitons for incoming and outgoing to run in asyncio.gather() to run them "toghether"
@@ -466,7 +564,10 @@ class HostComms:
 
     # Create Async Method to handle the connection
     async def establish_connection(self): # Send "connect" command until ack is sent back
-        if self.comm_mode == "serial":
+        if self.transport is not None:
+            self.candyser = self.transport
+            self.candyser.flush_ser_buffer()
+        elif self.comm_mode == "serial":
             self.candyser = usb_serial()
             self.candyser.flush_ser_buffer()
         elif self.comm_mode == "ble":
@@ -495,6 +596,9 @@ class HostComms:
         # Create background tasks to handle communication and connection maintenance
         self.run_comm_handler = asyncio.create_task(self.comm_handler())
         self.run_connection_watchdog = asyncio.create_task(self.connection_watchdog())
+        if self.bridge is not None and self.run_bridge_handler is None:
+            self.run_bridge_handler = asyncio.create_task(self.bridge.bridge_handler(self))
+        self.run_deadline_scheduler = asyncio.create_task(self.scheduler.run())
         self.OutgoingBuffer.flush()
 
     # Create method to dispense candy
@@ -503,17 +607,50 @@ class HostComms:
         if is_arduino:
             self.timeout = time.monotonic() + 0.5
             self.pixels[0] = (10, 0, 0)
+        self.candy_dispensed = False # Clear the previous dispense cycle
+        self.candy_taken = False
         self.enqueue_message(comm_dict["dispense_candy"])
 
+    def dispense_at(self, deadline): # Dispense at a time.monotonic() deadline, returns a schedule id or None
+        if not self.is_connected: # A queued deadline would fire late once a connection is made
+            print("Warning: Not connected, dispense not scheduled")
+            return None
+        self.candy_dispensed = False
+        self.candy_taken = False
+        return self.scheduler.schedule(deadline, comm_dict["dispense_candy"])
+
+    def dispense_after(self, delay): # Dispense delay seconds from now, returns a schedule id or None
+        return self.dispense_at(time.monotonic() + delay)
+
+    def dispense_jitter(self) -> dict: # Scheduled vs actual send time statistics for dispense_at
+        return self.scheduler.jitter_stats()
+
     async def disconnect(self):
         self.enqueue_message(comm_dict["disconnect"])
 
+    # Create methods for consuming events
+    def events(self, maxsize=64): # async for event in host.events(), ends when the connection drops
+        # Use async with host.events() as events, or await events.aclose(), to unsubscribe when leaving early
+        return self.event_hub.subscribe(maxsize)
+
+    def add_event_callback(self, callback): # Thread safe, callback(event) is called on the comm loop
+        self.event_hub.add_callback(callback)
+
+    def remove_event_callback(self, callback):
+        self.event_hub.remove_callback(callback)
+
+    def publish_event(self, message): # Stamp an event and hand it to subscribers and the bridge
+        event = self.event_hub.publish(message)
+        if self.bridge is not None:
+            self.bridge.publish(message, event.timestamp)
+
     # Create method to recognize dispense operation
     async def dispense_recognized(self): # Acknowledge a successful dispense
         # set bool for succecssful dispense to true
         print("successful dispense")
         self.candy_dispensed = True
-        #self.candy_stats["candy_dispensed"] += 1
+        self.candy_stats["candy_disepnsed"] += 1
+        self.publish_event(ack_dict[comm_dict["dispense_candy"]])
         return
 
     async def taken_candy(self): # Acknowledge that candy has been taken
@@ -521,20 +658,32 @@ class HostComms:
 
         self.enqueue_message(ack_dict[comm_dict["candy_taken"]])
         self.candy_taken = True
+        self.candy_stats["candy_taken"] += 1
+        self.publish_event(comm_dict["candy_taken"])
+
+    async def jam_recognized(self): # Acknowledge that the dispenser is jammed or empty
+        print("dispenser jammed or empty")
+        self.candy_stats["jam_or_empty"] += 1
+        self.enqueue_message(ack_dict[comm_dict["jam_or_empty"]])
+        self.publish_event(comm_dict["jam_or_empty"])
 
     async def disconnect_recognized(self): #disconnect from the client
         print("Disconnected")
         self.is_connected = False
         self.run_comm_handler.cancel()
         self.run_connection_watchdog.cancel()
-        if self.comm_mode == 'ble':
+        self.cancel_session_tasks()
+        if not self.link_is_serial():
             self.ble_ser.disconnect()
             self.ble_ser = None
+        self.publish_event(ack_dict[comm_dict["disconnect"]])
+        self.event_hub.close_subscriptions()
 
     async def message_interpreter(self):  # pull a message from the buffer and figure out what it means
         message_interpertations = {
             "@iD"   :   self.dispense_recognized,
             "$FD"   :   self.taken_candy,
+            "%JP"   :   self.jam_recognized,
             "@rs"   :   self.reset_watchdog,
             "@fl"   :   self.disconnect_recognized,
 
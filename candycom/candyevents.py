@@ -0,0 +1,136 @@
+# Typed event stream for HostComms
+# Lets consumers react to dispense, take, jam and disconnect events without polling booleans
+# 10/19/2026
+#---------------------------------------------------------------------------------------------------#
+import asyncio
+import time
+from collections import deque
+try:
+    import threading
+except ImportError: # CircuitPython has no threads, callbacks are only registered from the loop there
+    threading = None
+
+#---------------------------------------------------------------------------------------------------#
+# Map the frames HostComms reports on to event kinds
+
+event_kinds = {
+    "@iD" : "candy_dispensed",
+    "$FD" : "candy_taken",
+    "%JP" : "jam_or_empty",
+    "@fl" : "disconnected",
+}
+
+class CandyEvent:
+    __slots__ = ("seq", "timestamp", "frame", "kind")
+
+    def __init__(self, seq: int, timestamp: float, frame: str):
+        self.seq = seq # Increments by one for every event published by a hub
+        self.timestamp = timestamp # time.monotonic() when the event was published
+        self.frame = frame
+        self.kind = event_kinds.get(frame, frame)
+
+    def __repr__(self):
+        return f"CandyEvent(seq={self.seq}, timestamp={self.timestamp:.6f}, kind={self.kind!r})"
+
+#---------------------------------------------------------------------------------------------------#
+# Create a bounded queue per subscriber, the oldest event is dropped and counted when it overflows
+
+class EventSubscription:
+    def __init__(self, hub, maxsize=64):
+        self.hub = hub
+        self.maxsize = maxsize
+        self.queue = deque((), maxsize)
+        self.overflow = 0 # Number of events dropped because the consumer fell behind
+        self.closed = False
+        self.ready = asyncio.Event()
+
+    def put(self, event: CandyEvent):
+        if len(self.queue) == self.maxsize:
+            self.overflow += 1
+        self.queue.append(event)
+        self.ready.set()
+
+    def get_nowait(self): # Return the next event or None
+        if self.queue:
+            return self.queue.popleft()
+        self.ready.clear()
+        return None
+
+    async def get(self): # Wait for the next event, returns None once closed and drained
+        while True:
+            event = self.get_nowait()
+            if event is not None or self.closed:
+                return event
+            await self.ready.wait()
+
+    def close(self): # Stop iteration once the remaining events are consumed
+        self.closed = True
+        self.ready.set()
+        self.hub.unsubscribe(self)
+
+    async def aclose(self): # Unsubscribe now, for consumers that leave async for early
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info): # async with host.events() as events: unsubscribes on break or error
+        self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self.get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+#---------------------------------------------------------------------------------------------------#
+# Create the hub that stamps events and fans them out to subscribers and callbacks
+
+class EventHub:
+    def __init__(self):
+        self.seq = 0
+        self.subscribers = ()
+        self.callbacks = ()
+        # Lists are swapped rather than mutated so publish never holds the lock
+        self.lock = threading.Lock() if threading is not None else None
+
+    def _swap(self, name, update):
+        if self.lock is not None:
+            with self.lock:
+                setattr(self, name, update(getattr(self, name)))
+        else:
+            setattr(self, name, update(getattr(self, name)))
+
+    def subscribe(self, maxsize=64) -> EventSubscription:
+        subscription = EventSubscription(self, maxsize)
+        self._swap("subscribers", lambda subs: subs + (subscription,))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._swap("subscribers", lambda subs: tuple(sub for sub in subs if sub is not subscription))
+
+    def add_callback(self, callback): # callback(event) runs on the comm loop, keep it short
+        self._swap("callbacks", lambda cbs: cbs + (callback,))
+
+    def remove_callback(self, callback):
+        # Equality, not identity: every access to obj.method creates a new bound method object
+        self._swap("callbacks", lambda cbs: tuple(cb for cb in cbs if cb != callback))
+
+    def publish(self, frame: str) -> CandyEvent:
+        event = CandyEvent(self.seq, time.monotonic(), frame)
+        self.seq += 1
+        for subscription in self.subscribers:
+            subscription.put(event)
+        for callback in self.callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Warning: event callback failed: {e}")
+        return event
+
+    def close_subscriptions(self): # End every async for loop, used when the connection drops
+        for subscription in self.subscribers:
+            subscription.close()
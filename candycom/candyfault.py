@@ -0,0 +1,279 @@
+# Fault injecting transport and simulated dispenser for candycom
+# Sits between HostComms and a serial-like backend to measure behaviour on a bad link
+# 10/19/2026
+#---------------------------------------------------------------------------------------------------#
+import math
+import random
+import time
+from collections import deque
+from .candyreliable import ReliableEngine
+
+#---------------------------------------------------------------------------------------------------#
+# Describe a link condition, all rates are per byte except disconnect_rate which is per second
+
+class FaultProfile:
+    def __init__(self, latency=0.0, jitter=0.0, bandwidth=None, drop_rate=0.0, corrupt_rate=0.0,
+                 disconnect_rate=0.0, outage=1.0, seed=0):
+        self.latency = latency # seconds added to every byte
+        self.jitter = jitter # up to this many extra seconds, uniformly distributed
+        self.bandwidth = bandwidth # bytes per second, None for unlimited
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.disconnect_rate = disconnect_rate # expected disconnects per second
+        self.outage = outage # seconds the link stays down after a disconnect
+        self.seed = seed
+
+fault_profiles = {
+    "clean"         :   FaultProfile(),
+    "usb_long_run"  :   FaultProfile(latency=0.002, jitter=0.001, corrupt_rate=0.002),
+    "ble_noisy"     :   FaultProfile(latency=0.015, jitter=0.010, bandwidth=2000, drop_rate=0.002, corrupt_rate=0.002),
+    "slow_link"     :   FaultProfile(latency=0.050, bandwidth=120),
+    "flaky"         :   FaultProfile(latency=0.005, jitter=0.002, disconnect_rate=0.05, outage=2.0),
+}
+
+#---------------------------------------------------------------------------------------------------#
+# Model one direction of the link, bytes stay in order like they would on a serial line
+
+class LinkDirection:
+    def __init__(self, profile, rng, stats):
+        self.profile = profile
+        self.rng = rng
+        self.stats = stats
+        self.queue = deque() # (deliver_time, byte)
+        self.wire_free = 0.0 # when the previous byte has finished serialising
+        self.last_delivery = 0.0
+
+    def send(self, data, now, link_up):
+        profile = self.profile
+        for byte in data:
+            self.stats["bytes_sent"] += 1
+            if not link_up or self.rng.random() < profile.drop_rate:
+                self.stats["bytes_dropped"] += 1
+                continue
+            if self.rng.random() < profile.corrupt_rate:
+                # Flip any one bit, non-ascii results reach HostComms as unknown frames
+                byte ^= 1 << self.rng.randrange(8)
+                self.stats["bytes_corrupted"] += 1
+            ready = now
+            if profile.bandwidth:
+                ready = max(now, self.wire_free) + 1 / profile.bandwidth
+                self.wire_free = ready
+            deliver = max(ready + profile.latency + self.rng.random() * profile.jitter, self.last_delivery)
+            self.last_delivery = deliver
+            self.queue.append((deliver, byte))
+
+    def ready_count(self, now) -> int:
+        count = 0
+        for deliver, _ in self.queue:
+            if deliver > now:
+                break
+            count += 1
+        return count
+
+    def oldest_wait(self, now) -> float: # How long the first ready byte has been waiting
+        if not self.queue or self.queue[0][0] > now:
+            return 0.0
+        return now - self.queue[0][0]
+
+    def take(self, nbytes, now) -> bytes:
+        data = bytearray()
+        while self.queue and len(data) < nbytes and self.queue[0][0] <= now:
+            data.append(self.queue.popleft()[1])
+        return bytes(data)
+
+    def clear(self):
+        self.queue.clear()
+
+#---------------------------------------------------------------------------------------------------#
+# Create the middleware transport, it exposes the same interface as candyserial.usb_serial
+
+class FaultyTransport:
+    def __init__(self, backend, profile=None, read_timeout=1.0, frame_size=3):
+        self.backend = backend
+        self.profile = profile if profile is not None else FaultProfile()
+        self.read_timeout = read_timeout # Partial frames are released after this, like a serial read timeout
+        self.frame_size = frame_size # Bytes the reader consumes at once, 1 for byte oriented readers
+        self.rng = random.Random(self.profile.seed)
+        self.stats = {
+            "bytes_sent"        :   0,
+            "bytes_dropped"     :   0,
+            "bytes_corrupted"   :   0,
+            "disconnects"       :   0,
+        }
+        self.tx = LinkDirection(self.profile, self.rng, self.stats) # host -> backend
+        self.rx = LinkDirection(self.profile, self.rng, self.stats) # backend -> host
+        self.link_up = True
+        self.outage_until = 0.0
+        self.outages = [] # (start, end) of every simulated disconnect
+        self.last_update = time.monotonic()
+
+    def _update_link(self, now): # A disconnect drops bytes until the outage ends, the backend never sees it
+        if not self.link_up:
+            if now >= self.outage_until:
+                self.link_up = True
+        elif self.profile.disconnect_rate:
+            # Poisson arrivals: chance of at least one disconnect since the last update
+            if self.rng.random() < 1 - math.exp(-self.profile.disconnect_rate * (now - self.last_update)):
+                self.link_up = False
+                self.outage_until = now + self.profile.outage
+                self.outages.append((now, self.outage_until))
+                self.stats["disconnects"] += 1
+        self.last_update = now
+
+    def pump(self): # Move bytes whose delivery time has passed, called on every access
+        now = time.monotonic()
+        self._update_link(now)
+        ready = self.tx.ready_count(now)
+        if ready:
+            self.backend.write(self.tx.take(ready, now))
+        while self.backend.check_ser_buffer(): # One byte at a time so a serial backend never blocks
+            data = self.backend.read_bytes(1)
+            if not data:
+                break
+            self.rx.send(data, now, self.link_up)
+        return now
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        now = time.monotonic()
+        self._update_link(now)
+        self.tx.send(data, now, self.link_up)
+        self.pump()
+
+    def read(self, nbytes=32):
+        data = self.read_bytes(nbytes)
+        if data:
+            return data.decode('utf-8', errors='replace')
+        return None
+
+    def read_bytes(self, nbytes=32):
+        now = self.pump()
+        return self.rx.take(nbytes, now)
+
+    def check_ser_buffer(self):
+        # Report data once a full frame arrived, or a partial one timed out as a blocking read would
+        now = self.pump()
+        ready = self.rx.ready_count(now)
+        return ready >= self.frame_size or (ready > 0 and self.rx.oldest_wait(now) >= self.read_timeout)
+
+    def flush_ser_buffer(self):
+        self.tx.clear()
+        self.rx.clear()
+        self.backend.flush_ser_buffer()
+
+#---------------------------------------------------------------------------------------------------#
+# Adapt BleHost to the serial-like interface so it can sit behind FaultyTransport
+
+class BleSerialAdapter:
+    def __init__(self, ble_host):
+        self.ble_host = ble_host # Must already be connected
+
+    def write(self, data): # Raw bytes straight to the uart, BleHost.write would re-encode text
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.ble_host.uart_service.write(bytes(data))
+
+    def read(self, nbytes=32):
+        data = self.read_bytes(nbytes)
+        if data:
+            return data.decode('utf-8', errors='replace')
+        return None
+
+    def read_bytes(self, nbytes=32):
+        return self.ble_host.uart_service.read(nbytes) or b""
+
+    def check_ser_buffer(self):
+        return self.ble_host.uart_service.in_waiting > 0
+
+    def flush_ser_buffer(self):
+        self.ble_host.uart_service.reset_input_buffer()
+
+#---------------------------------------------------------------------------------------------------#
+# Create an in-memory dispenser that answers like ClientComms, for benchmarking without hardware
+
+class SimulatedDispenser:
+    def __init__(self, dispense_time=0.2, take_time=0.3, reliable=False):
+        self.dispense_time = dispense_time # Motor rotation before @iD is sent
+        self.take_time = take_time # Delay between @iD and $FD
+        # Speak the candyreliable packet format, like ClientComms(..., reliable=True)
+        self.engine = ReliableEngine() if reliable else None
+        self.incoming = bytearray()
+        self.outgoing = bytearray()
+        self.scheduled = [] # sorted list of (due, frame)
+        self.replies = {
+            b"~ES" : b"@es",
+            b"~RS" : b"@rs",
+            b"~QD" : b"@qD",
+            b"~FL" : b"@fl",
+        }
+        self.stats = {
+            "frames_received"   :   0,
+            "unknown_frames"    :   0,
+            "dispensed"         :   0,
+        }
+
+    def _schedule(self, due, frame):
+        self.scheduled.append((due, frame))
+        self.scheduled.sort()
+
+    def _handle(self, frame, now):
+        if frame in self.replies:
+            self._schedule(now, self.replies[frame])
+        elif frame == b"~ID":
+            self.stats["dispensed"] += 1
+            self._schedule(now + self.dispense_time, b"@iD")
+            self._schedule(now + self.dispense_time + self.take_time, b"$FD")
+        elif frame not in (b"@fd", b"@jp"): # Acks from the host need no reply
+            self.stats["unknown_frames"] += 1
+            return
+        self.stats["frames_received"] += 1
+
+    def _release(self, now):
+        while self.scheduled and self.scheduled[0][0] <= now:
+            frame = self.scheduled.pop(0)[1]
+            if self.engine is not None:
+                self.engine.send(frame)
+            else:
+                self.outgoing += frame
+        if self.engine is not None:
+            self.engine.poll(now, self.outgoing.extend)
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        now = time.monotonic()
+        if self.engine is not None:
+            self.engine.feed(data)
+            frame = self.engine.receive()
+            while frame is not None:
+                self._handle(frame, now)
+                frame = self.engine.receive()
+            return
+        self.incoming += data
+        while len(self.incoming) >= 3: # Like the board, read blindly in 3 byte frames
+            frame = bytes(self.incoming[:3])
+            del self.incoming[:3]
+            self._handle(frame, now)
+
+    def read(self, nbytes=32):
+        data = self.read_bytes(nbytes)
+        if data:
+            return data.decode('utf-8', errors='replace')
+        return None
+
+    def read_bytes(self, nbytes=32):
+        self._release(time.monotonic())
+        data = bytes(self.outgoing[:nbytes])
+        del self.outgoing[:nbytes]
+        return data
+
+    def check_ser_buffer(self):
+        self._release(time.monotonic())
+        return len(self.outgoing) > 0
+
+    def flush_ser_buffer(self):
+        self.incoming.clear()
+        self.outgoing.clear()
+        if self.engine is not None:
+            self.engine.reset()
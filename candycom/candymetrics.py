@@ -0,0 +1,148 @@
+# Local metrics exporter for candycom
+# Serves OpenMetrics text and JSON for one or more HostComms over localhost HTTP or a Unix socket
+# Runs on the same event loop as HostComms, scrapes are answered from a cached snapshot
+# 10/19/2026
+#---------------------------------------------------------------------------------------------------#
+import asyncio
+import json
+import time
+
+#---------------------------------------------------------------------------------------------------#
+# Metric families: name, type, help and how to read the value from a HostComms
+
+metric_families = (
+    ("candycom_connected", "gauge", "1 if the device is connected",
+        lambda host: int(host.is_connected)),
+    ("candycom_incoming_queue_depth", "gauge", "Frames waiting in IncommingBuffer",
+        lambda host: host.IncommingBuffer.size),
+    ("candycom_outgoing_queue_depth", "gauge", "Frames waiting in OutgoingBuffer",
+        lambda host: host.OutgoingBuffer.size),
+    ("candycom_watchdog_timer", "gauge", "Current watchdog count, the link drops at watchdog_timeout",
+        lambda host: host.watchdog_timer),
+    ("candycom_frames_sent", "counter", "Frames written to the link",
+        lambda host: host.link_stats["frames_sent"]),
+    ("candycom_frames_received", "counter", "Valid frames read from the link",
+        lambda host: host.link_stats["frames_received"]),
+    ("candycom_unknown_frames", "counter", "Unrecognized frames read from the link",
+        lambda host: host.link_stats["unknown_frames"]),
+    ("candycom_watchdog_misses", "counter", "Watchdog ticks where the previous maintain_connection was not acked",
+        lambda host: host.link_stats["watchdog_misses"]),
+    ("candycom_dispenses", "counter", "Dispenses acknowledged by the dispenser",
+        lambda host: host.candy_stats["candy_disepnsed"]),
+    ("candycom_takes", "counter", "Candy taken events",
+        lambda host: host.candy_stats["candy_taken"]),
+    ("candycom_jams", "counter", "Jam or empty events",
+        lambda host: host.candy_stats["jam_or_empty"]),
+)
+
+OPENMETRICS_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+JSON_TYPE = "application/json"
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+#---------------------------------------------------------------------------------------------------#
+# Create the exporter
+
+class MetricsExporter:
+    def __init__(self, devices=None, interval=1.0):
+        self.devices = dict(devices) if devices else {} # device name -> HostComms
+        self.interval = interval # seconds between snapshots
+        self.servers = []
+        self.run_snapshotter = None
+        self.previous = {} # device name -> (time, total frames) for the frames/sec gauge
+        self.snapshot = {}
+        self.rendered = {"openmetrics": b"# EOF\n", "json": b"{}"}
+        self.take_snapshot()
+
+    def add_device(self, name, host):
+        self.devices[name] = host
+
+    def remove_device(self, name):
+        self.devices.pop(name, None)
+        self.previous.pop(name, None)
+
+    def take_snapshot(self): # Read every device once and pre-render both formats
+        now = time.monotonic()
+        snapshot = {}
+        for name, host in self.devices.items():
+            values = {family: read(host) for family, _, _, read in metric_families}
+            frames = values["candycom_frames_sent"] + values["candycom_frames_received"]
+            last_time, last_frames = self.previous.get(name, (now, frames))
+            elapsed = now - last_time
+            values["candycom_frames_per_second"] = (frames - last_frames) / elapsed if elapsed > 0 else 0.0
+            self.previous[name] = (now, frames)
+            snapshot[name] = values
+        self.snapshot = snapshot
+        self.rendered = {
+            "openmetrics": self.render_openmetrics(snapshot).encode('utf-8'),
+            "json": json.dumps({"timestamp": time.time(), "devices": snapshot}).encode('utf-8'),
+        }
+
+    def render_openmetrics(self, snapshot) -> str:
+        families = metric_families + (
+            ("candycom_frames_per_second", "gauge", "Frames sent and received per second since the last snapshot", None),
+        )
+        lines = []
+        for family, kind, help_text, _ in families:
+            lines.append(f"# TYPE {family} {kind}")
+            lines.append(f"# HELP {family} {help_text}")
+            suffix = "_total" if kind == "counter" else ""
+            for name, values in snapshot.items():
+                lines.append(f"{family}{suffix}{{device=\"{escape_label(name)}\"}} {values[family]}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    async def snapshotter(self): # Background task refreshing the cached snapshot
+        while True:
+            await asyncio.sleep(self.interval)
+            self.take_snapshot()
+
+    async def handle_client(self, reader, writer): # Minimal HTTP/1.0 style handler, one request per connection
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            while True: # Skip the headers
+                line = await asyncio.wait_for(reader.readline(), timeout=5)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+            parts = request.decode('latin-1').split()
+            path = parts[1] if len(parts) >= 2 else ""
+            if parts and parts[0] not in ("GET", "HEAD"):
+                status, content_type, body = "405 Method Not Allowed", "text/plain", b"method not allowed\n"
+            elif path in ("/metrics", "/"):
+                status, content_type, body = "200 OK", OPENMETRICS_TYPE, self.rendered["openmetrics"]
+            elif path == "/metrics.json":
+                status, content_type, body = "200 OK", JSON_TYPE, self.rendered["json"]
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"not found\n"
+            header = (f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                      f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n")
+            writer.write(header.encode('latin-1'))
+            if parts and parts[0] != "HEAD":
+                writer.write(body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=9464, unix_path=None): # Serve on localhost, or a Unix socket if given
+        # Can be called again to listen on both a port and a Unix socket
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle_client, path=unix_path)
+            print(f"candycom metrics on unix socket {unix_path}")
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port)
+            print(f"candycom metrics on http://{host}:{port}/metrics")
+        self.servers.append(server)
+        if self.run_snapshotter is None:
+            self.run_snapshotter = asyncio.create_task(self.snapshotter())
+
+    async def stop(self):
+        if self.run_snapshotter is not None:
+            self.run_snapshotter.cancel()
+            self.run_snapshotter = None
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+        self.servers = []
@@ -0,0 +1,344 @@
+# Optional reliability layer for candycom
+# Checksummed packets, a sliding window of unacknowledged frames, cumulative acks and selective retransmit
+# Both ends must enable it: HostComms(transport=ReliableTransport(...)) and ClientComms(..., reliable=True)
+# 10/19/2026
+#---------------------------------------------------------------------------------------------------#
+import time
+
+#---------------------------------------------------------------------------------------------------#
+# Packet layout, 8 bytes
+#
+#   "#"  kind  seq  ack  frame(3)  check
+#
+# kind is "D" for a data packet carrying a candycom frame and "A" for a pure ack.
+# seq and ack count modulo 128. ack is cumulative: the next sequence number the sender expects.
+# In an ack packet the frame bytes are a selective ack bitmap instead: bit i (byte i // 8, bit i % 8)
+# is set when frame ack + 1 + i is already held, so the sender only resends the gaps.
+# check is a CRC-8 over kind..frame and uses all 8 bits, so packets are handled as raw bytes.
+
+PACKET_SYNC = 0x23 # "#", never used by candycom frames
+PACKET_DATA = 0x44 # "D"
+PACKET_ACK = 0x41 # "A"
+PACKET_SIZE = 8
+SEQ_SPACE = 128
+SACK_BITS = 24 # Frames past the cumulative ack covered by the bitmap
+
+def _crc8_table():
+    table = bytearray(256)
+    for value in range(256):
+        crc = value
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table[value] = crc
+    return bytes(table)
+
+crc8_table = _crc8_table()
+
+def packet_check(packet) -> int: # CRC-8 (poly 0x07) of bytes 1..6
+    crc = 0
+    index = 1
+    while index < 7:
+        crc = crc8_table[crc ^ packet[index]]
+        index += 1
+    return crc
+
+def seq_distance(later, earlier) -> int: # Steps from earlier to later, modulo the sequence space
+    # Kept non-negative, CPython allocates ints below -5 and benchmarks/client_alloc.py runs under CPython
+    return (later + SEQ_SPACE - earlier) % SEQ_SPACE
+
+def build_packet_into(packet, kind, seq, ack, frame, offset=0): # Fill a preallocated 8 byte buffer
+    packet[0] = PACKET_SYNC
+    packet[1] = kind
+    packet[2] = seq
+    packet[3] = ack
+    packet[4] = frame[offset] # Element-wise, slicing would allocate
+    packet[5] = frame[offset + 1]
+    packet[6] = frame[offset + 2]
+    packet[7] = packet_check(packet)
+    return packet
+
+def build_packet(kind, seq, ack, frame) -> bytes:
+    return bytes(build_packet_into(bytearray(PACKET_SIZE), kind, seq, ack, frame))
+
+#---------------------------------------------------------------------------------------------------#
+# Create the protocol engine, it does no I/O itself so both roles share it.
+# All state lives in buffers sized by the window, so steady state traffic allocates nothing on the board
+
+class ReliableEngine:
+    def __init__(self, window=16, timeout=0.25):
+        if not 0 < window <= SEQ_SPACE // 2: # Selective repeat needs the window within half the sequence space
+            raise ValueError("window must be between 1 and 64")
+        self.window = window
+        self.timeout = timeout # seconds before an unacknowledged frame is sent again
+        self.stats = {
+            "frames_sent"       :   0,
+            "retransmits"       :   0,
+            "frames_delivered"  :   0,
+            "duplicates"        :   0,
+            "bad_packets"       :   0,
+        }
+        # Sender slots, the frame with sequence tx_base + i lives in slot (tx_head + i) % window
+        self.tx_frames = bytearray(3 * window)
+        self.tx_sent = [None] * window # time.monotonic() of the last send, None until first sent
+        self.tx_sacked = bytearray(window) # 1 once the peer reported holding the frame
+        # Receiver slots, the frame with sequence read_seq + i lives in slot (rx_head + i) % window
+        self.rx_frames = bytearray(3 * window)
+        self.rx_present = bytearray(window)
+        self.rx_packet = bytearray(PACKET_SIZE) # Packet being parsed
+        self.tx_packet = bytearray(PACKET_SIZE) # Packet being written, reused for every send
+        self.rx_frame = bytearray(3) # Scratch frame for receive()
+        self.sack = bytearray(3) # Selective ack bitmap being written
+        self.reset()
+
+    def reset(self): # Start both directions from sequence 0
+        # Sender state
+        self.tx_base = 0 # oldest unacknowledged sequence number
+        self.tx_head = 0
+        self.next_seq = 0
+        self.backlog = [] # frames waiting for room in the window, only used when it is full
+        # Receiver state
+        self.read_seq = 0 # next frame handed to the application
+        self.rx_head = 0
+        self.expected = 0 # next frame not yet received in order, sent back as the cumulative ack
+        self.ack_pending = False
+        self.rx_len = 0
+        index = 0
+        while index < self.window:
+            self.tx_sent[index] = None
+            self.tx_sacked[index] = 0
+            self.rx_present[index] = 0
+            index += 1
+
+    def in_flight(self) -> int: # Frames in the window, sent or waiting for their first send
+        return seq_distance(self.next_seq, self.tx_base)
+
+    def send(self, frame): # Queue a 3 byte frame for reliable delivery
+        if isinstance(frame, str):
+            frame = frame.encode('utf-8')
+        if self.backlog or self.in_flight() == self.window:
+            self.backlog.append(bytes(frame))
+            return
+        self._admit(frame)
+
+    def _admit(self, frame): # Give a frame the next sequence number, poll() sends it
+        slot = 3 * ((self.tx_head + self.in_flight()) % self.window)
+        self.tx_frames[slot] = frame[0]
+        self.tx_frames[slot + 1] = frame[1]
+        self.tx_frames[slot + 2] = frame[2]
+        self.tx_sent[slot // 3] = None
+        self.tx_sacked[slot // 3] = 0
+        self.next_seq = (self.next_seq + 1) % SEQ_SPACE
+
+    def pending_frames(self) -> int: # In-order frames ready for the application
+        return seq_distance(self.expected, self.read_seq)
+
+    def receive_into(self, buf) -> int: # Copy the next in-order frame into buf, returns 3 or 0
+        if self.expected == self.read_seq:
+            return 0
+        slot = self.rx_head
+        buf[0] = self.rx_frames[3 * slot]
+        buf[1] = self.rx_frames[3 * slot + 1]
+        buf[2] = self.rx_frames[3 * slot + 2]
+        self.rx_present[slot] = 0
+        self.rx_head = (slot + 1) % self.window
+        self.read_seq = (self.read_seq + 1) % SEQ_SPACE
+        return 3
+
+    def receive(self): # Next in-order frame as bytes, or None
+        if self.receive_into(self.rx_frame):
+            return bytes(self.rx_frame)
+        return None
+
+    def _handle_ack(self, ack):
+        acked = seq_distance(ack, self.tx_base)
+        if acked == 0 or acked > self.in_flight(): # Stale or bogus ack
+            return
+        self.tx_base = ack
+        self.tx_head = (self.tx_head + acked) % self.window
+
+    def _handle_sack(self, ack, packet): # Mark frames the peer already holds so poll() skips them
+        bit = 0
+        while bit < SACK_BITS:
+            if packet[4 + bit // 8] & (1 << (bit % 8)):
+                # Frames behind tx_base (a stale ack) or past the window land outside in_flight
+                distance = seq_distance((ack + 1 + bit) % SEQ_SPACE, self.tx_base)
+                if distance < self.in_flight():
+                    self.tx_sacked[(self.tx_head + distance) % self.window] = 1
+            bit += 1
+
+    def _build_sack(self) -> bool: # Fill self.sack from the receive slots, returns True if any bit is set
+        sack = self.sack
+        sack[0] = 0
+        sack[1] = 0
+        sack[2] = 0
+        held = False
+        bit = 0
+        distance = seq_distance(self.expected, self.read_seq) + 1
+        while bit < SACK_BITS and distance < self.window:
+            if self.rx_present[(self.rx_head + distance) % self.window]:
+                sack[bit // 8] |= 1 << (bit % 8)
+                held = True
+            bit += 1
+            distance += 1
+        return held
+
+    def _handle_data(self, seq, packet):
+        self.ack_pending = True # Ack every data packet, including duplicates whose ack was lost
+        if seq_distance(seq, self.expected) >= self.window:
+            self.stats["duplicates"] += 1
+            return
+        distance = seq_distance(seq, self.read_seq)
+        if distance >= self.window:
+            return # No room until the application reads, the sender will retry
+        slot = (self.rx_head + distance) % self.window
+        if self.rx_present[slot]:
+            self.stats["duplicates"] += 1
+            return
+        self.rx_frames[3 * slot] = packet[4]
+        self.rx_frames[3 * slot + 1] = packet[5]
+        self.rx_frames[3 * slot + 2] = packet[6]
+        self.rx_present[slot] = 1
+        # Deliver this frame and any buffered ones that were waiting for it
+        distance = seq_distance(self.expected, self.read_seq)
+        while distance < self.window and self.rx_present[(self.rx_head + distance) % self.window]:
+            self.expected = (self.expected + 1) % SEQ_SPACE
+            self.stats["frames_delivered"] += 1
+            distance += 1
+
+    def feed_byte(self, byte): # Parse one raw byte from the link, resyncing past noise and bad checksums
+        packet = self.rx_packet
+        if self.rx_len == 0 and byte != PACKET_SYNC:
+            return
+        packet[self.rx_len] = byte
+        self.rx_len += 1
+        if self.rx_len < PACKET_SIZE:
+            return
+        if (packet_check(packet) != packet[7] or packet[1] not in (PACKET_DATA, PACKET_ACK)
+                or packet[2] >= SEQ_SPACE or packet[3] >= SEQ_SPACE):
+            self.stats["bad_packets"] += 1
+            # Restart from the next sync byte inside the rejected packet
+            start = 1
+            while start < PACKET_SIZE and packet[start] != PACKET_SYNC:
+                start += 1
+            index = 0
+            while start + index < PACKET_SIZE:
+                packet[index] = packet[start + index]
+                index += 1
+            self.rx_len = index
+            return
+        self.rx_len = 0
+        self._handle_ack(packet[3])
+        if packet[1] == PACKET_DATA:
+            self._handle_data(packet[2], packet)
+        else:
+            self._handle_sack(packet[3], packet)
+
+    def feed(self, data): # Parse a run of raw bytes
+        index = 0
+        while index < len(data):
+            self.feed_byte(data[index])
+            index += 1
+
+    def poll(self, now, write): # Send timed out frames, new frames and acks by calling write(packet)
+        # write gets the same reused buffer every time, copy it if it has to be kept
+        while self.backlog and self.in_flight() < self.window:
+            self._admit(self.backlog.pop(0))
+        wrote = False
+        count = self.in_flight()
+        # Frames below the highest selectively acked one are known gaps. Past it the peer has said
+        # nothing, the frames may be fine and only the ack lost, so only the oldest of them is probed
+        known_lost = count
+        while known_lost > 0 and not self.tx_sacked[(self.tx_head + known_lost - 1) % self.window]:
+            known_lost -= 1
+        probed = False
+        index = 0
+        while index < count:
+            slot = (self.tx_head + index) % self.window
+            sent = self.tx_sent[slot]
+            resend = False
+            if sent is not None and not self.tx_sacked[slot] and now - sent >= self.timeout:
+                # Only frames whose own timer expired and that the peer does not hold are resent
+                resend = index < known_lost or not probed
+                probed = True
+            if sent is None or resend:
+                if sent is None:
+                    self.stats["frames_sent"] += 1
+                else:
+                    self.stats["retransmits"] += 1
+                seq = (self.tx_base + index) % SEQ_SPACE
+                write(build_packet_into(self.tx_packet, PACKET_DATA, seq, self.expected, self.tx_frames, 3 * slot))
+                self.tx_sent[slot] = now
+                wrote = True
+            index += 1
+        if self.ack_pending:
+            # Data packets carry the cumulative ack, a pure ack is still sent when frames are held past a gap
+            if self._build_sack() or not wrote:
+                write(build_packet_into(self.tx_packet, PACKET_ACK, 0, self.expected, self.sack))
+            self.ack_pending = False
+
+#---------------------------------------------------------------------------------------------------#
+# Host side, wraps a serial-like transport (candyserial.usb_serial, candyfault.FaultyTransport)
+
+class ReliableTransport:
+    def __init__(self, backend, window=16, timeout=0.25):
+        self.backend = backend
+        self.engine = ReliableEngine(window, timeout)
+
+    def service(self): # Pull raw bytes, run the timers and push packets out
+        while self.backend.check_ser_buffer():
+            data = self.backend.read_bytes(1)
+            if not data:
+                break
+            self.engine.feed(data)
+        self.engine.poll(time.monotonic(), self.backend.write)
+
+    def write(self, data):
+        self.engine.send(data)
+        self.service()
+
+    def read(self, nbytes=3): # Returns one frame at a time, HostComms always reads 3 bytes
+        frame = self.read_bytes(nbytes)
+        if frame:
+            return frame.decode('utf-8', errors='replace')
+        return None
+
+    def read_bytes(self, nbytes=3):
+        self.service()
+        return self.engine.receive() or b""
+
+    def check_ser_buffer(self):
+        self.service()
+        return self.engine.pending_frames() > 0
+
+    def flush_ser_buffer(self):
+        self.backend.flush_ser_buffer()
+        self.engine.reset()
+
+#---------------------------------------------------------------------------------------------------#
+# Client side, wraps a usb_cdc.data style stream (in_waiting, readinto, write)
+
+class ReliableStream:
+    def __init__(self, stream, window=16, timeout=0.25):
+        self.stream = stream
+        self.engine = ReliableEngine(window, timeout)
+        self.rx_byte = bytearray(1)
+        self.write_packet = stream.write # Bound once, looking it up per packet would allocate
+
+    def service(self):
+        stream = self.stream
+        while stream.in_waiting: # One byte at a time, readinto on usb_cdc blocks until the buffer is full
+            stream.readinto(self.rx_byte)
+            self.engine.feed_byte(self.rx_byte[0])
+        self.engine.poll(time.monotonic(), self.write_packet)
+
+    @property
+    def in_waiting(self) -> int: # Polled by comm_handler every iteration, which also drives the timers
+        self.service()
+        return self.engine.pending_frames() * 3
+
+    def readinto(self, buf):
+        return self.engine.receive_into(buf)
+
+    def write(self, data):
+        self.engine.send(data)
+        self.service()
@@ -0,0 +1,96 @@
+# Deadline scheduler for HostComms
+# Writes pre-staged frames at a monotonic deadline, bypassing the outgoing buffer, and measures jitter
+# 10/19/2026
+#---------------------------------------------------------------------------------------------------#
+import asyncio
+import time
+from collections import deque
+
+#---------------------------------------------------------------------------------------------------#
+# Create the scheduler, one per HostComms instance
+
+class DeadlineScheduler:
+    def __init__(self, host, spin=0.002, history=256):
+        self.host = host
+        # asyncio.sleep wakes up late by up to a few ms (~15 ms on Windows), so the last stretch
+        # before a deadline is busy-waited. Raise this on platforms with a coarse timer.
+        self.spin = spin
+        self.pending = [] # sorted list of [deadline, seq, staged frame, message]
+        self.seq = 0
+        self.wakeup = None
+        # (seq, scheduled, started, finished) for the most recent sends, started/finished bracket the write
+        self.history = deque((), history)
+
+    def schedule(self, deadline: float, message: str) -> int: # Stage a frame for a time.monotonic() deadline
+        seq = self.seq
+        self.seq += 1
+        self.pending.append([deadline, seq, self.host.stage_message(message), message])
+        self.pending.sort()
+        if self.wakeup is not None:
+            self.wakeup.set() # Re-evaluate in case the new deadline is the earliest
+        return seq
+
+    def cancel(self, seq: int) -> bool: # Remove a scheduled frame that has not been sent yet
+        for entry in self.pending:
+            if entry[1] == seq:
+                self.pending.remove(entry)
+                return True
+        return False
+
+    def clear(self) -> int: # Drop every frame that has not been sent yet, returns how many
+        dropped = len(self.pending)
+        self.pending.clear()
+        return dropped
+
+    async def run(self): # Background task started by HostComms once connected
+        self.wakeup = asyncio.Event()
+        print("running deadline scheduler")
+        try:
+            await self._run()
+        finally: # Also reached when HostComms cancels the task on disconnect
+            self.wakeup = None
+            print("deadline scheduler exited")
+
+    async def _run(self):
+        while self.host.is_connected:
+            self.wakeup.clear()
+            if not self.pending:
+                await self.wakeup.wait()
+                continue
+            deadline = self.pending[0][0]
+            coarse = deadline - self.spin - time.monotonic()
+            if coarse > 0:
+                try: # Sleep until shortly before the deadline unless a new frame is scheduled
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=coarse)
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+            if not self.pending or self.pending[0][0] != deadline:
+                continue # cancelled while sleeping
+            deadline, seq, staged, message = self.pending.pop(0)
+            while time.monotonic() < deadline:
+                pass
+            started = time.monotonic()
+            self.host.write_message(staged)
+            finished = time.monotonic() # The frame has been handed to the OS or the reliability layer
+            self.host.raise_flag(message)
+            self.history.append((seq, deadline, started, finished))
+
+    def jitter_stats(self) -> dict: # Summarise sent - scheduled time, in seconds, sent is when the write returned
+        errors = sorted(finished - scheduled for _, scheduled, _, finished in self.history)
+        writes = sorted(finished - started for _, _, started, finished in self.history)
+        count = len(errors)
+        if count == 0:
+            return {"count": 0}
+        mean = sum(errors) / count
+        variance = sum((error - mean) ** 2 for error in errors) / count
+        return {
+            "count"         :   count,
+            "mean"          :   mean,
+            "stdev"         :   variance ** 0.5,
+            "min"           :   errors[0],
+            "max"           :   errors[-1],
+            "p99"           :   errors[min(count - 1, int(count * 0.99))],
+            "write_mean"    :   sum(writes) / count, # Time spent inside write_message itself
+            "write_max"     :   writes[-1],
+        }
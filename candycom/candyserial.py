@@ -56,9 +56,13 @@ class usb_serial:
         """Read data from the USB serial connection."""
         data = self.ser.read(nbytes)
         if data:
-            return data.decode('utf-8') 
+            return data.decode('utf-8', errors='replace') # Line noise becomes an unknown frame instead of raising
         return None 
 
+    def read_bytes(self, nbytes=32):
+        """Read raw bytes from the USB serial connection."""
+        return self.ser.read(nbytes)
+
     def check_ser_buffer(self):
         """Check if there's data waiting in the serial buffer."""
         return self.ser.in_waiting > 0
\ No newline at end of file
@@ -22,7 +22,7 @@ setup(
     ],
     package_dir={"": "."},
     packages=find_packages(),
-    python_requires=">=3.6",
+    python_requires=">=3.8",
     install_requires=[
         "adafruit-blinka",
         "adafruit-circuitpython-ble",